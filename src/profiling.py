@@ -0,0 +1,250 @@
+"""
+Profiling support for the command line interface.
+
+Runs a command either under cProfile, to report the time per stage, or under
+tracemalloc, to report the memory per stage. A stage is a set of functions
+(e.g. the record formatting). Time and memory are measured in separate runs,
+so that the memory instrumentation doesn't distort the timing.
+
+Example usage:
+
+>>> profiler = Profiler()
+... profiler.stage("format", [("tfd500_cli.py", "_format_record")],
+...                 namespace=module, name="_format_record")
+... result = profiler.run(command, logger, args)
+... profiler.dump_stats("dump.pstats")
+... profiler.report()
+"""
+
+# Prepare for python 3
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Standard imports
+import cProfile
+import functools
+import inspect
+import pstats
+import sys
+import tracemalloc
+
+
+def _matches(functions, filename, function):
+    return any(
+        filename.endswith(name[0]) and function == name[1]
+        for name in functions)
+
+
+class _Stage(object):
+    """
+    Time and memory figures of a single stage.
+    """
+
+    def __init__(self, label, functions, callers, exclude):
+        self.label     = label
+        self.functions = functions
+        self.callers   = callers
+        self.exclude   = exclude
+        self.calls     = 0
+        self.time      = 0.0
+        self.measured  = False
+        self.transient = 0
+        self.peak      = 0
+
+
+class Profiler(object):
+    """
+    Run a command under cProfile or tracemalloc.
+    """
+
+    def __init__(self, memory=False):
+        """
+        Args:
+            memory(bool): If True, measure the memory per stage with
+                tracemalloc. Otherwise, measure the time per stage with
+                cProfile.
+        """
+        self.memory  = memory
+        self.profile = cProfile.Profile()
+        self.stages  = []
+        self.peak    = 0
+        self.current = 0
+        self._stack  = []
+        self._patched = []
+
+    def stage(self, label, functions, callers=(), exclude=(), namespace=None,
+              name=None):
+        """
+        Define a stage.
+
+        Args:
+            label(str): Name of the stage as shown in the report.
+            functions(list): (filename, function name) tuples identifying the
+                functions in the cProfile output which belong to this stage.
+                Builtins have the file name "~". The stage's time is the sum
+                of their cumulative times.
+            callers(list): Functions in the same format. If given, only calls
+                made directly from one of them are part of the stage.
+            exclude(list): Functions in the same format whose cumulative
+                time is subtracted when they are called from the stage's
+                functions, e.g. because they form a stage of their own.
+            namespace: Optional module or class containing the callable
+                'name'. If given, the callable is replaced by a wrapper during
+                a memory run to measure the memory allocated while it
+                executes, excluding the memory measured for nested stages.
+            name(str): Name of the callable within 'namespace'.
+        """
+        stage = _Stage(label, functions, callers, exclude)
+        self.stages.append(stage)
+        if namespace is not None:
+            stage.measured = True
+            self._patched.append((namespace, name, self._wrap(stage, name,
+                                                            namespace)))
+
+    def _enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        # reset_peak() below clears the interpreter wide peak, so keep track
+        # of the overall peak here.
+        self.peak = max(self.peak, peak)
+        if self._stack:
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self._stack.append(
+            {"start": current, "peak": current, "nested": 0,
+             "nested_peak": 0})
+
+    def _leave(self, stage):
+        _current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        frame = self._stack.pop()
+        peak = max(peak, frame["peak"])
+        total = peak - frame["start"]
+        # Memory used by nested stages is accounted to them, not to this one.
+        stage.calls += 1
+        stage.transient += max(0, total - frame["nested"])
+        stage.peak = max(stage.peak, total - frame["nested_peak"])
+        if self._stack:
+            outer = self._stack[-1]
+            outer["peak"] = max(outer["peak"], peak)
+            outer["nested"] += total
+            outer["nested_peak"] = max(outer["nested_peak"], total)
+
+    def _wrap(self, stage, name, namespace):
+        func = getattr(namespace, name, None)
+        if func is None:
+            # e.g. a builtin like print, shadowed in the module's namespace
+            func = getattr(sys.modules["builtins"], name)
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                generator = func(*args, **kwargs)
+                while True:
+                    self._enter()
+                    try:
+                        value = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self._leave(stage)
+                    yield value
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if stage.callers:
+                    code = sys._getframe(1).f_code  # pylint:disable=W0212
+                    if not _matches(
+                            stage.callers, code.co_filename, code.co_name):
+                        return func(*args, **kwargs)
+                self._enter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._leave(stage)
+        return wrapper
+
+    def run(self, func, *args):
+        """
+        Run func(*args) and return its result.
+        """
+        if not self.memory:
+            self.profile.enable()
+            try:
+                return func(*args)
+            finally:
+                self.profile.disable()
+                self._collect()
+
+        originals = []
+        for namespace, name, wrapper in self._patched:
+            originals.append((namespace, name, namespace.__dict__.get(name)))
+            setattr(namespace, name, wrapper)
+        tracemalloc.start()
+        try:
+            return func(*args)
+        finally:
+            self.current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            tracemalloc.stop()
+            for namespace, name, original in originals:
+                if original is None:
+                    delattr(namespace, name)
+                else:
+                    setattr(namespace, name, original)
+
+    def _collect(self):
+        stats = pstats.Stats(self.profile).stats
+        for stage in self.stages:
+            for (filename, _line, function), values in stats.items():
+                _cc, calls, _tt, cumulative, callers = values
+                if _matches(stage.functions, filename, function):
+                    if not stage.callers:
+                        stage.calls += calls
+                        stage.time += cumulative
+                        continue
+                    for caller, caller_values in callers.items():
+                        if _matches(stage.callers, caller[0], caller[2]):
+                            stage.calls += caller_values[0]
+                            stage.time += caller_values[3]
+                elif _matches(stage.exclude, filename, function):
+                    # Only the time spent on behalf of this stage.
+                    for caller, caller_values in callers.items():
+                        if _matches(stage.functions, caller[0], caller[2]):
+                            stage.time -= caller_values[3]
+
+    def dump_stats(self, filename):
+        """Write the cProfile data to 'filename' in pstats format."""
+        self.profile.dump_stats(filename)
+
+    def report(self, records=0, output=sys.stderr):
+        """
+        Print the stage report.
+
+        Args:
+            records(int): Number of processed records. If not zero, memory
+                figures are also given per record.
+            output: File to print to.
+        """
+        if not self.memory:
+            print("%-10s %10s %10s" % ("stage", "calls", "time [s]"),
+                  file=output)
+            for stage in self.stages:
+                print("%-10s %10d %10.3f"
+                      % (stage.label, stage.calls, stage.time), file=output)
+            return
+
+        # tracemalloc only knows the memory blocks alive at a given time, so
+        # these are byte figures rather than allocation counts.
+        print("%-10s %10s %14s %14s"
+              % ("stage", "calls", "peak [bytes]", "bytes/record"),
+              file=output)
+        for stage in self.stages:
+            if not stage.measured:
+                continue
+            per_record = "%.1f" % (stage.transient / records) \
+                if records else "-"
+            print("%-10s %10d %14d %14s"
+                  % (stage.label, stage.calls, stage.peak, per_record),
+                  file=output)
+        print("Peak traced memory: %d bytes" % self.peak, file=output)
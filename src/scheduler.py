@@ -0,0 +1,217 @@
+"""
+Fill rate aware collection scheduling for TFD500 data loggers.
+
+The time at which a logger's flash memory runs full follows from its
+recording start, interval and mode. The scheduler uses this to plan the next
+collection of each logger just ahead of the overflow and spreads the
+collections of several loggers over time.
+
+Example usage:
+
+>>> schedule = Schedule("tfd500-schedule.json")
+... entry = schedule.entry("/dev/ttyUSB0")
+... entry.update(logger.configuration(), margin, now, logger.is_busy())
+... schedule.spread(spacing, ["/dev/ttyUSB0"])
+... schedule.save()
+"""
+
+# Prepare for python 3
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Standard imports
+import datetime
+import json
+import os
+
+# Project imports.
+from tfd500 import FLASH_BLOCKS, capacity
+
+
+# Format used for time stamps in the state file.
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _to_string(stamp):
+    return None if stamp is None else stamp.strftime(TIME_FORMAT)
+
+
+def _from_string(value):
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, TIME_FORMAT)
+
+
+def fill_time(config, blocks=FLASH_BLOCKS):
+    """
+    Return the time at which the logger's flash memory will be full, i.e.
+    the time of the last record that fits. Like expected_count(), this puts
+    the first record at the recording start.
+
+    Args:
+        config(dict): The logger configuration as returned by
+            Tfd500.configuration().
+        blocks(int): Number of available flash blocks.
+    Returns:
+        A datetime.datetime object.
+    """
+    records = capacity(config["humidity"], blocks)
+    return config["start"] + datetime.timedelta(
+        seconds=(records - 1) * config["interval"])
+
+
+def expected_count(config, now):
+    """
+    Return the number of records the logger should have recorded by 'now'.
+
+    This is used when the logger is recording and doesn't report its count.
+    """
+    elapsed = (now - config["start"]).total_seconds()
+    return max(0, int(elapsed // config["interval"]) + 1)
+
+
+class Entry(object):
+    """
+    Scheduling state of a single logger.
+    """
+
+    def __init__(self, device, start=None, collected=0, due=None, output=None):
+        """
+        Args:
+            device(str): Path to the logger's serial device.
+            start(datetime.datetime): Start of the recording the state
+                refers to.
+            collected(int): Number of records already collected from this
+                recording.
+            due(datetime.datetime): Time of the next collection.
+            output(str): File the collected records are appended to.
+        """
+        self.device    = device
+        self.start     = start
+        self.collected = collected
+        self.due       = due
+        self.output    = output
+        self.fill      = None
+
+    def update(self, config, margin, now, recording, blocks=FLASH_BLOCKS):
+        """
+        Update the entry from the logger's current configuration and plan the
+        next collection.
+
+        A recording logger is planned 'margin' ahead of its flash overflow.
+        An idle logger doesn't fill up any further; it is due right away if it
+        holds records not collected so far.
+
+        Args:
+            config(dict): The logger configuration.
+            margin(datetime.timedelta): Safety margin before the overflow.
+            now(datetime.datetime): The current time.
+            recording(bool): True if the logger is currently recording.
+            blocks(int): Number of available flash blocks.
+        """
+        if config["start"] != self.start or config["count"] < self.collected:
+            # A new recording has been started (possibly with the same start
+            # time, e.g. after clearing the flash); nothing collected from it
+            # yet.
+            self.start = config["start"]
+            self.collected = 0
+        if recording:
+            self.fill = fill_time(config, blocks)
+            self.due = self.fill - margin
+        else:
+            full = config["count"] >= capacity(config["humidity"], blocks)
+            self.fill = fill_time(config, blocks) if full else None
+            self.due = now if config["count"] > self.collected else None
+
+    def reset(self):
+        """Forget the recording, e.g. after the flash has been cleared."""
+        self.start = None
+        self.collected = 0
+
+    def is_due(self, now):
+        """Return True if the logger should be collected at 'now'."""
+        return self.due is not None and self.due <= now
+
+    def to_dict(self):
+        """Return the entry as a JSON serializable dictionary."""
+        return {
+            "start"    : _to_string(self.start),
+            "collected": self.collected,
+            "due"      : _to_string(self.due),
+            "output"   : self.output,
+            }
+
+    @classmethod
+    def from_dict(cls, device, values):
+        """Create an entry from a dictionary returned by to_dict()."""
+        return cls(
+            device,
+            start     = _from_string(values.get("start")),
+            collected = values.get("collected", 0),
+            due       = _from_string(values.get("due")),
+            output    = values.get("output"))
+
+
+class Schedule(object):
+    """
+    Collection schedule for a set of loggers, persisted as a JSON file.
+    """
+
+    def __init__(self, filename):
+        """
+        Args:
+            filename(str): Name of the state file. It will be created on
+                save() if it doesn't exist yet.
+        """
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as state:
+                for device, values in json.load(state).items():
+                    self.entries[device] = Entry.from_dict(device, values)
+
+    def entry(self, device):
+        """Return the entry for 'device', creating it if necessary."""
+        if device not in self.entries:
+            self.entries[device] = Entry(device)
+        return self.entries[device]
+
+    def spread(self, spacing, devices):
+        """
+        Make sure that no two collections of the given devices are closer
+        than 'spacing'. Due times are only ever moved forward in time (i.e.
+        earlier), so that spreading never postpones a collection past its
+        overflow margin.
+
+        Args:
+            spacing(datetime.timedelta): Minimum time between collections.
+            devices(iterable): The devices to consider. Other entries, e.g.
+                stale ones for loggers no longer in use, are left alone.
+        """
+        planned = sorted(
+            (self.entries[device] for device in devices
+             if device in self.entries and self.entries[device].due is not None),
+            key=lambda entry: entry.due,
+            reverse=True)
+        for later, earlier in zip(planned, planned[1:]):
+            if later.due - earlier.due < spacing:
+                earlier.due = later.due - spacing
+
+    def next_due(self, now):
+        """
+        Return the time of the next collection after 'now' or None. Entries
+        which are already past due (e.g. skipped because the logger was
+        recording) are not considered.
+        """
+        due = [entry.due for entry in self.entries.values()
+               if entry.due is not None and entry.due > now]
+        return min(due) if due else None
+
+    def save(self):
+        """Write the schedule to its state file."""
+        values = dict(
+            (device, entry.to_dict())
+            for device, entry in self.entries.items())
+        with open(self.filename, "w") as state:
+            json.dump(values, state, indent=2, sort_keys=True)
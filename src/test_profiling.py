@@ -0,0 +1,132 @@
+"""
+Tests for the profiling support.
+"""
+
+# Prepare for python 3
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Standard imports
+import io
+import sys
+import time
+import unittest
+
+# Project imports.
+from profiling import Profiler
+
+MODULE = sys.modules[__name__]
+OUTER = [("test_profiling.py", "_outer")]
+INNER = [("test_profiling.py", "_inner")]
+
+OUTER_BYTES = 200000
+INNER_BYTES = 1000000
+OUTER_SLEEP = 0.02
+INNER_SLEEP = 0.05
+
+
+def _inner():
+    buffer = bytearray(INNER_BYTES)
+    time.sleep(INNER_SLEEP)
+    return len(buffer)
+
+
+def _outer():
+    buffer = bytearray(OUTER_BYTES)
+    time.sleep(OUTER_SLEEP)
+    print("record", file=io.StringIO())
+    return _inner() + len(buffer)
+
+
+def _command(seen):
+    seen.append(MODULE.__dict__.get("print"))
+    # Calls of _inner from outside of _outer.
+    _inner()
+    return [_outer() for _ in range(3)]
+
+
+ORIGINALS = (_outer, _inner)
+
+
+class ProfilerTest(unittest.TestCase):
+    """Tests for running a command with nested stages."""
+
+    def _profiler(self, memory):
+        profiler = Profiler(memory)
+        profiler.stage(
+            "outer", OUTER, exclude=INNER,
+            namespace=MODULE, name="_outer")
+        profiler.stage(
+            "inner", INNER, callers=OUTER,
+            namespace=MODULE, name="_inner")
+        profiler.stage(
+            "print", [("~", "<built-in method builtins.print>")],
+            callers=OUTER,
+            namespace=MODULE, name="print")
+        return profiler
+
+    def _stages(self, profiler):
+        return dict((stage.label, stage) for stage in profiler.stages)
+
+    def _assert_restored(self):
+        self.assertNotIn("print", MODULE.__dict__)
+        self.assertIs(MODULE._outer, ORIGINALS[0])
+        self.assertIs(MODULE._inner, ORIGINALS[1])
+
+    def test_time(self):
+        profiler = self._profiler(memory=False)
+        seen = []
+        self.assertEqual(profiler.run(_command, seen),
+                         [INNER_BYTES + OUTER_BYTES] * 3)
+        # No wrappers are used when measuring time.
+        self.assertEqual(seen, [None])
+        self._assert_restored()
+        stages = self._stages(profiler)
+        self.assertEqual(stages["outer"].calls, 3)
+        self.assertEqual(stages["inner"].calls, 3)
+        self.assertEqual(stages["print"].calls, 3)
+        for stage in profiler.stages:
+            self.assertGreaterEqual(stage.time, 0)
+        self.assertAlmostEqual(stages["outer"].time, 3 * OUTER_SLEEP,
+                               delta=0.5 * 3 * OUTER_SLEEP)
+        self.assertAlmostEqual(stages["inner"].time, 3 * INNER_SLEEP,
+                               delta=0.5 * 3 * INNER_SLEEP)
+
+        output = io.StringIO()
+        profiler.report(3, output=output)
+        self.assertIn("outer", output.getvalue())
+
+    def test_memory(self):
+        profiler = self._profiler(memory=True)
+        seen = []
+        profiler.run(_command, seen)
+        self.assertIsNotNone(seen[0])
+        self._assert_restored()
+        stages = self._stages(profiler)
+        self.assertEqual(stages["outer"].calls, 3)
+        self.assertEqual(stages["inner"].calls, 3)
+        self.assertEqual(stages["print"].calls, 3)
+        # The inner buffer is accounted to the inner stage only.
+        self.assertGreaterEqual(stages["inner"].peak, INNER_BYTES)
+        self.assertLess(stages["inner"].peak, INNER_BYTES + 50000)
+        self.assertGreaterEqual(stages["outer"].peak, OUTER_BYTES)
+        self.assertLess(stages["outer"].peak, OUTER_BYTES + 50000)
+        self.assertLess(stages["outer"].transient, 3 * (OUTER_BYTES + 50000))
+        self.assertGreaterEqual(profiler.peak, INNER_BYTES + OUTER_BYTES)
+
+        output = io.StringIO()
+        profiler.report(3, output=output)
+        self.assertIn("Peak traced memory", output.getvalue())
+
+    def test_restore_on_exit(self):
+        def command():
+            sys.exit(1)
+
+        profiler = self._profiler(memory=True)
+        self.assertRaises(SystemExit, profiler.run, command)
+        self._assert_restored()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Tests for the collection scheduler.
+"""
+
+# Prepare for python 3
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Standard imports
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+# Project imports.
+from scheduler import Entry, Schedule, expected_count, fill_time
+from tfd500 import capacity, records_per_block
+
+START = datetime.datetime(2015, 7, 20, 11, 44, 56)
+MARGIN = datetime.timedelta(hours=1)
+
+
+def _config(count=0, humidity=True, interval=60):
+    return {
+        "count"   : count,
+        "start"   : START,
+        "humidity": humidity,
+        "interval": interval,
+        }
+
+
+class CapacityTest(unittest.TestCase):
+    """Tests for the capacity and fill time calculation."""
+
+    def test_capacity(self):
+        self.assertEqual(records_per_block(False), 128)
+        self.assertEqual(records_per_block(True), 85)
+        self.assertEqual(capacity(False, 10), 1280)
+        self.assertEqual(capacity(True, 10), 850)
+
+    def test_fill_time(self):
+        self.assertEqual(
+            fill_time(_config(humidity=False, interval=10), blocks=2),
+            START + datetime.timedelta(seconds=255 * 10))
+        self.assertEqual(
+            fill_time(_config(humidity=True, interval=300), blocks=2),
+            START + datetime.timedelta(seconds=169 * 300))
+
+    def test_fill_time_matches_expected_count(self):
+        config = _config(humidity=True, interval=60)
+        full = fill_time(config, blocks=2)
+        self.assertEqual(expected_count(config, full), capacity(True, 2))
+        self.assertEqual(
+            expected_count(config, full - datetime.timedelta(seconds=1)),
+            capacity(True, 2) - 1)
+
+    def test_expected_count(self):
+        config = _config(interval=60)
+        self.assertEqual(expected_count(config, START), 1)
+        self.assertEqual(
+            expected_count(config, START + datetime.timedelta(seconds=119)), 2)
+        self.assertEqual(
+            expected_count(config, START - datetime.timedelta(hours=1)), 0)
+
+
+class EntryTest(unittest.TestCase):
+    """Tests for planning a single logger."""
+
+    def test_recording(self):
+        entry = Entry("a")
+        entry.update(_config(count=10), MARGIN, START, True, blocks=2)
+        self.assertEqual(entry.fill, fill_time(_config(), blocks=2))
+        self.assertEqual(entry.due, entry.fill - MARGIN)
+
+    def test_idle(self):
+        now = START + datetime.timedelta(days=1)
+        entry = Entry("a")
+        entry.update(_config(count=10), MARGIN, now, False, blocks=2)
+        self.assertIsNone(entry.fill)
+        self.assertEqual(entry.due, now)
+        entry.collected = 10
+        entry.update(_config(count=10), MARGIN, now, False, blocks=2)
+        self.assertIsNone(entry.due)
+
+    def test_idle_full(self):
+        now = START + datetime.timedelta(days=1)
+        entry = Entry("a")
+        entry.update(_config(count=170), MARGIN, now, False, blocks=2)
+        self.assertEqual(entry.fill, fill_time(_config(), blocks=2))
+
+    def test_cleared_with_same_start(self):
+        entry = Entry("a", start=START, collected=100)
+        entry.update(_config(count=20), MARGIN, START, False)
+        self.assertEqual(entry.start, START)
+        self.assertEqual(entry.collected, 0)
+        self.assertEqual(entry.due, START)
+
+    def test_new_recording(self):
+        entry = Entry("a", start=START, collected=10)
+        config = _config(count=5)
+        config["start"] = START + datetime.timedelta(days=1)
+        entry.update(config, MARGIN, config["start"], True)
+        self.assertEqual(entry.start, config["start"])
+        self.assertEqual(entry.collected, 0)
+
+
+class ScheduleTest(unittest.TestCase):
+    """Tests for the schedule of several loggers."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spread(self):
+        spacing = datetime.timedelta(minutes=5)
+        schedule = Schedule(self.filename)
+        schedule.entry("a").due = START
+        schedule.entry("b").due = START + datetime.timedelta(minutes=1)
+        schedule.entry("c").due = START + datetime.timedelta(hours=1)
+        schedule.entry("d")
+        schedule.entry("e").due = START + datetime.timedelta(minutes=2)
+        schedule.spread(spacing, ["a", "b", "c", "d", "x"])
+        self.assertEqual(schedule.entry("c").due,
+                         START + datetime.timedelta(hours=1))
+        self.assertEqual(schedule.entry("b").due,
+                         START + datetime.timedelta(minutes=1))
+        self.assertEqual(schedule.entry("a").due,
+                         START - datetime.timedelta(minutes=4))
+        self.assertIsNone(schedule.entry("d").due)
+        # Not given, so left alone.
+        self.assertEqual(schedule.entry("e").due,
+                         START + datetime.timedelta(minutes=2))
+
+    def test_next_due(self):
+        schedule = Schedule(self.filename)
+        self.assertIsNone(schedule.next_due(START))
+        schedule.entry("a").due = START - datetime.timedelta(minutes=1)
+        schedule.entry("b").due = START + datetime.timedelta(minutes=5)
+        schedule.entry("c").due = START + datetime.timedelta(minutes=10)
+        self.assertEqual(schedule.next_due(START),
+                         START + datetime.timedelta(minutes=5))
+
+    def test_save_and_load(self):
+        schedule = Schedule(self.filename)
+        entry = schedule.entry("/dev/ttyUSB0")
+        entry.start = START
+        entry.collected = 42
+        entry.due = START + datetime.timedelta(days=2)
+        entry.output = "tfd500-ttyUSB0.csv"
+        schedule.entry("/dev/ttyUSB1")
+        schedule.save()
+
+        loaded = Schedule(self.filename)
+        self.assertEqual(sorted(loaded.entries),
+                         ["/dev/ttyUSB0", "/dev/ttyUSB1"])
+        entry = loaded.entry("/dev/ttyUSB0")
+        self.assertEqual(entry.start, START)
+        self.assertEqual(entry.collected, 42)
+        self.assertEqual(entry.due, START + datetime.timedelta(days=2))
+        self.assertEqual(entry.output, "tfd500-ttyUSB0.csv")
+        entry = loaded.entry("/dev/ttyUSB1")
+        self.assertIsNone(entry.start)
+        self.assertEqual(entry.collected, 0)
+        self.assertIsNone(entry.due)
+
+
+if __name__ == "__main__":
+    unittest.main()
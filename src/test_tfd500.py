@@ -0,0 +1,83 @@
+"""
+Tests for the TFD500 abstraction class, using a stub for the serial transfer.
+"""
+
+# Prepare for python 3
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Standard imports
+import datetime
+import struct
+import unittest
+
+# Project imports.
+from tfd500 import Tfd500
+
+START = datetime.datetime(2015, 7, 20, 11, 44, 56)
+
+
+class _StubTfd500(Tfd500):
+    """
+    Logger whose flash holds the record numbers as temperature values.
+    """
+
+    def __init__(self, count, humidity):
+        super(_StubTfd500, self).__init__()
+        self.count_ = count
+        self.humidity_ = humidity
+        self.blocks = []
+
+    def xfer(self, cmd, expected, parameters=b"", raw=False):
+        if cmd == "d":
+            return "%06d 20.07.15 11:44:56" % self.count_
+        if cmd == "o":
+            return "C%d I1 T20.07.15 12:34:56" % self.humidity_
+        assert cmd == "F"
+        block = int(parameters)
+        self.blocks.append(block)
+        if self.humidity_:
+            first = block * 85
+            values = []
+            for number in range(first, first + 85):
+                values += [number, number % 100]
+            return struct.pack(">" + "hb" * 85, *values) + b"\0"
+        first = block * 128
+        return struct.pack(">128h", *range(first, first + 128))
+
+
+class ReadTest(unittest.TestCase):
+    """Tests for reading the records."""
+
+    def _records(self, logger, first=0):
+        return [value for values in logger.read(first) for value in values]
+
+    def test_read_all(self):
+        logger = _StubTfd500(300, False)
+        records = self._records(logger)
+        self.assertEqual(len(records), 300)
+        self.assertEqual(logger.blocks, [0, 1, 2])
+        self.assertEqual(records[0], (START, 0.0))
+        self.assertEqual(
+            records[-1], (START + datetime.timedelta(minutes=299), 29.9))
+        self.assertEqual(records, list(
+            value for values in logger for value in values))
+
+    def test_read_from_mid_block(self):
+        logger = _StubTfd500(300, True)
+        records = self._records(logger, 100)
+        self.assertEqual(logger.blocks, [1, 2, 3])
+        self.assertEqual(len(records), 200)
+        self.assertEqual(
+            records[0], (START + datetime.timedelta(minutes=100), 10.0, 0))
+        self.assertEqual(
+            records[-1], (START + datetime.timedelta(minutes=299), 29.9, 99))
+
+    def test_read_nothing_new(self):
+        logger = _StubTfd500(300, False)
+        self.assertEqual(self._records(logger, 300), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,35 @@ import struct
 import serial
 
 
+# Size of a single flash block as transferred by the "F" command.
+BLOCK_SIZE = 256
+
+# Number of flash blocks available for recording (128000 bytes).
+FLASH_BLOCKS = 500
+
+
+def records_per_block(humidity):
+    """
+    Return the number of records stored in a single flash block.
+
+    Args:
+        humidity(bool): True if humidity is recorded as well. Each record
+            then takes three bytes instead of two.
+    """
+    return BLOCK_SIZE // (3 if humidity else 2)
+
+
+def capacity(humidity, blocks=FLASH_BLOCKS):
+    """
+    Return the number of records which fit into the logger's flash memory.
+
+    Args:
+        humidity(bool): True if humidity is recorded as well.
+        blocks(int): Number of available flash blocks.
+    """
+    return blocks * records_per_block(humidity)
+
+
 class Tfd500(object):
     """
     TFD500 abstraction class.
@@ -89,16 +118,32 @@ class Tfd500(object):
             contains time and temperature. Otherwise, each tuple contains
             time, temperature and humidity.
         """
-        config = self.configuration()
+        return self.read()
+
+    def read(self, first=0, config=None):
+        """
+        Return data blocks from the device, starting with the block holding
+        record number 'first'. Records before 'first' are skipped, so this
+        can be used to fetch only the records added since a previous read.
+
+        Args:
+            first(int): Number of the first record to return.
+            config(dict): Optional configuration as returned by
+                configuration(). If None, the configuration will be read
+                from the logger.
+        Returns:
+            A list of tuples for each block, see __iter__().
+        """
+        config = config or self.configuration()
         number_of_points = config["count"]
-        timestamp = config["start"]
         has_humidity = config["humidity"]
         delta = datetime.timedelta(seconds=config["interval"])
-        block = 0
-        count = 0
+        block = first // records_per_block(has_humidity)
+        count = block * records_per_block(has_humidity)
+        timestamp = config["start"] + count * delta
 
         while count < number_of_points:
-            record = self.xfer("F", 256, "%04d" % block, True)
+            record = self.xfer("F", BLOCK_SIZE, "%04d" % block, True)
             data = []
             # Due to the USB protocol being block oriented, the last block
             # returned may contain more values than logged, so we need to count.
@@ -108,15 +153,17 @@ class Tfd500(object):
                 for value in zip(values[0::2], values[1::2]):
                     if count >= number_of_points:
                         break
-                    data.append((timestamp, value[0] / 10.0, value[1]))
+                    if count >= first:
+                        data.append((timestamp, value[0] / 10.0, value[1]))
                     timestamp += delta
                     count += 1
             else:
                 values = struct.unpack(">128h", record)
                 for value in values:
-                    if count >= config["count"]:
+                    if count >= number_of_points:
                         break
-                    data.append((timestamp, value / 10.0))
+                    if count >= first:
+                        data.append((timestamp, value / 10.0))
                     timestamp += delta
                     count += 1
             block += 1
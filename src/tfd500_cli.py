@@ -17,10 +17,15 @@ import datetime
 import math
 import os
 import sys
+import time
+
+# Non-standard imports
+import serial
 
 # Project imports.
-from tfd500 import Tfd500
+from tfd500 import FLASH_BLOCKS, Tfd500, capacity
 from progress import ProgressBar
+from scheduler import Schedule, expected_count
 
 
 def cmd_status(logger, args):
@@ -183,27 +188,23 @@ def _open_output(args, config):
     return output
 
 
-def cmd_dump(logger, args):
+def _default_data_format(args, config):
+    if args.data_format:
+        return args.data_format
+    data_format = "%c;%d;%t"
+    if config["humidity"]:
+        data_format += ";%h"
+    return data_format
+
+
+def _write_records(logger, config, output, args, first=0, progress=None):
     """
-    Dump recorded values into a file or to stdout.
+    Write the logger's records, starting at record number 'first', to
+    'output' and return the number of records written.
     """
-    if logger.is_busy():
-        print("Logger is currently recording.")
-        return 1
-    config = logger.configuration()
-    if config["count"] == 0:
-        print("No records available (nothing has been logged).")
-        return 0
-    output = _open_output(args, config)
-    progress = None if args.no_progress else ProgressBar(config['count'])
-    if args.data_format:
-        data_format = args.data_format
-    else:
-        data_format = "%c;%d;%t"
-        if config["humidity"]:
-            data_format += ";%h"
-    counter = 0
-    for values in logger:
+    data_format = _default_data_format(args, config)
+    counter = first
+    for values in logger.read(first, config):
         for value in values:
             stamp, temp, hum = value
             record = _format_record(
@@ -216,11 +217,137 @@ def cmd_dump(logger, args):
             counter += 1
         if progress is not None:
             progress += len(values)
+    return counter - first
+
+
+def cmd_dump(logger, args):
+    """
+    Dump recorded values into a file or to stdout.
+    """
+    if logger.is_busy():
+        print("Logger is currently recording.")
+        return 1
+    config = logger.configuration()
+    if config["count"] == 0:
+        print("No records available (nothing has been logged).")
+        return 0
+    output = _open_output(args, config)
+    progress = None if args.no_progress else ProgressBar(config['count'])
+    _write_records(logger, config, output, args, progress=progress)
     if progress is not None:
         print()
     return 0
 
 
+def _collect(logger, entry, config, args):
+    """
+    Append the records not collected so far to the entry's output file and
+    optionally restart the recording with an empty flash memory.
+    """
+    if entry.output is None:
+        entry.output = os.path.join(
+            args.output_dir,
+            "tfd500-%s.csv" % os.path.basename(entry.device))
+    with open(entry.output, "a") as output:
+        written = _write_records(
+            logger, config, output, args, first=entry.collected)
+    entry.collected += written
+    print("%s: collected %d records into '%s'"
+          % (entry.device, written, entry.output))
+    if args.restart:
+        logger.clear_flash()
+        # The new recording may report the same start time as the old one.
+        entry.reset()
+        logger.time = datetime.datetime.now()
+        logger.interval = config["interval"]
+        logger.humidity = config["humidity"]
+        print("%s: flash cleared, recording restarted" % entry.device)
+
+
+def _schedule_once(args, schedule):
+    """
+    Update the schedule for all devices and collect those which are due.
+
+    Returns:
+        A tuple of the time of the next collection (or None) and the list of
+        devices which were due but couldn't be collected, either because they
+        are recording or because they couldn't be accessed.
+    """
+    now = datetime.datetime.now()
+    margin = datetime.timedelta(seconds=args.margin)
+    busy = set()
+    missed = []
+    configs = {}
+    for device in args.devices:
+        logger = Tfd500(device)
+        entry = schedule.entry(device)
+        try:
+            config = logger.configuration()
+            recording = logger.is_busy()
+        except (serial.SerialException, IOError) as error:
+            # e.g. unplugged; don't let one logger stop the others.
+            print("%s: %s" % (device, error), file=sys.stderr)
+            missed.append(device)
+            continue
+        if recording:
+            busy.add(device)
+            config["count"] = min(
+                expected_count(config, now),
+                capacity(config["humidity"], args.blocks))
+        entry.update(config, margin, now, recording, args.blocks)
+        configs[device] = (logger, config)
+    schedule.spread(datetime.timedelta(seconds=args.spacing), configs)
+
+    for device in args.devices:
+        if device not in configs:
+            continue
+        logger, config = configs[device]
+        entry = schedule.entry(device)
+        print("%s: %d of %d records, %s, next collection at %s"
+              % (device, config["count"],
+                 capacity(config["humidity"], args.blocks),
+                 "not recording" if entry.fill is None
+                 else "full at %s" % entry.fill,
+                 entry.due or "none"))
+        if args.dry_run or not entry.is_due(now):
+            continue
+        if device in busy:
+            print("%s: collection due, but logger is currently recording."
+                  " Stop the recording to collect it." % device,
+                  file=sys.stderr)
+            missed.append(device)
+            continue
+        try:
+            _collect(logger, entry, config, args)
+        except (serial.SerialException, IOError) as error:
+            print("%s: %s" % (device, error), file=sys.stderr)
+            missed.append(device)
+            continue
+        # Save right away, so records already written aren't collected again
+        # if a later device fails.
+        schedule.save()
+    schedule.save()
+    return schedule.next_due(now), missed
+
+
+def cmd_schedule(logger, args):
+    """
+    Plan and perform collections ahead of each logger's flash overflow.
+    """
+    args.devices = args.devices or [logger.device]
+    schedule = Schedule(args.state)
+    while True:
+        next_due, missed = _schedule_once(args, schedule)
+        if not args.loop or args.dry_run:
+            # Non-zero, so that e.g. cron reports loggers about to overflow
+            # or missing loggers.
+            return 1 if missed else 0
+        delay = args.poll
+        if next_due is not None:
+            delay = (next_due - datetime.datetime.now()).total_seconds()
+        time.sleep(max(0, min(delay, args.poll)))
+
+
 def parse_args(args):
     """
     Parse the command line arguments and return a parsed version of them.
@@ -230,6 +357,19 @@ def parse_args(args):
         "--device", "-d",
         default="/dev/ttyUSB0",
         help="Path to the serial device. Defaults to /dev/ttyUSB0 if missing.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Run the command under cProfile, print the time per stage of the"
+             " dump (transfer, decode, format, dewpoint, strftime, write) and"
+             " write the profile data to FILE in pstats format.")
+    group.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Run the command under tracemalloc and print the peak memory"
+             " and bytes per record for each stage of the dump, plus the peak"
+             " memory of the whole command. Requires python 3.9 or newer.")
 
     subparsers = parser.add_subparsers(
         title="Available commands",
@@ -333,6 +473,77 @@ def parse_args(args):
              " with temperature and humidity.")
     subparser.set_defaults(func=cmd_dump)
 
+    subparser = subparsers.add_parser(
+        "schedule",
+        help="Predict when each logger's flash memory will be full and"
+             " collect the recorded data shortly before. The state is kept"
+             " in a file, so this can be run periodically (e.g. from cron).")
+    subparser.add_argument(
+        "devices",
+        nargs="*",
+        help="Paths to the serial devices of the loggers. Defaults to the"
+             " device given with --device.")
+    subparser.add_argument(
+        "--state", "-s",
+        default=os.path.expanduser("~/.tfd500-schedule.json"),
+        help="Name of the file keeping the schedule between runs. Defaults to"
+             " ~/.tfd500-schedule.json.")
+    subparser.add_argument(
+        "--output-dir", "-o",
+        default=".",
+        help="Directory to which the collected records will be appended, one"
+             " file per logger. Defaults to the current directory.")
+    subparser.add_argument(
+        "--margin", "-m",
+        type=int,
+        default=86400,
+        help="Number of seconds before the predicted overflow at which a"
+             " logger is due. A recording logger can't be read, so this is"
+             " also the time left to stop it by hand after the warning."
+             " Defaults to 86400 (one day).")
+    subparser.add_argument(
+        "--spacing",
+        type=int,
+        default=300,
+        help="Minimum number of seconds between the due times of two"
+             " recording loggers given in this run. This only staggers the"
+             " warnings for recording loggers; idle loggers are collected"
+             " right away, one after the other. Defaults to 300.")
+    subparser.add_argument(
+        "--blocks",
+        type=int,
+        default=FLASH_BLOCKS,
+        help="Number of 256 byte flash blocks available for recording."
+             " Defaults to %d." % FLASH_BLOCKS)
+    subparser.add_argument(
+        "--restart", "-r",
+        action="store_true",
+        help="After collecting a logger, clear its flash memory and restore"
+             " its configuration, so that recording continues. Without this"
+             " option, only the records not collected so far are fetched.")
+    subparser.add_argument(
+        "--dry-run", "-n",
+        action="store_true",
+        help="Only print and save the schedule; don't collect anything.")
+    subparser.add_argument(
+        "--loop", "-l",
+        action="store_true",
+        help="Keep running and collect each logger when it is due.")
+    subparser.add_argument(
+        "--poll",
+        type=int,
+        default=600,
+        help="Maximum number of seconds to sleep between two checks in"
+             " --loop mode. Defaults to 600.")
+    subparser.add_argument(
+        "--time-format", "-t",
+        default="%d.%m.%Y %H:%M:%S",
+        help="Format to use for printing time values (see dump).")
+    subparser.add_argument(
+        "--data-format", "-d",
+        help="Format to use for the data records (see dump).")
+    subparser.set_defaults(func=cmd_schedule)
+
     subparser = subparsers.add_parser(
         "clear-flash",
         help="Clear the flash memory. This removes all data records.")
@@ -352,11 +563,60 @@ def parse_args(args):
     return args
 
 
+def _profile(logger, args):
+    """
+    Run the selected command under the profiler and report the time or
+    memory used by the stages of the dump hot path.
+    """
+    # Only imported when needed: tracemalloc requires python 3.
+    from profiling import Profiler
+
+    module = sys.modules[__name__]
+    read = [("tfd500.py", "read")]
+    xfer = [("tfd500.py", "xfer")]
+    dewpoint_ = [("tfd500_cli.py", "dewpoint")]
+    write_records = [("tfd500_cli.py", "_write_records")]
+    profiler = Profiler(memory=args.profile_memory)
+    profiler.stage(
+        "transfer", xfer, callers=read,
+        namespace=Tfd500, name="xfer")
+    profiler.stage(
+        "decode", read, exclude=xfer,
+        namespace=Tfd500, name="read")
+    profiler.stage(
+        "format", [("tfd500_cli.py", "_format_record")], exclude=dewpoint_,
+        namespace=module, name="_format_record")
+    profiler.stage(
+        "dewpoint", dewpoint_,
+        namespace=module, name="dewpoint")
+    profiler.stage(
+        "strftime", [("~", "<method 'strftime' of 'datetime.date' objects>")],
+        callers=write_records)
+    profiler.stage(
+        "write", [("~", "<built-in method builtins.print>")],
+        callers=write_records,
+        namespace=module, name="print")
+    try:
+        return profiler.run(args.func, logger, args)
+    finally:
+        # Also report on failed runs, e.g. when the command calls sys.exit().
+        records = [stage.calls for stage in profiler.stages
+                   if stage.label == "format"][0]
+        profiler.report(records)
+        if args.profile:
+            profiler.dump_stats(args.profile)
+            print("Profile data written to '%s'" % args.profile,
+                  file=sys.stderr)
+
+
 def main(args):
     """Main program."""
     args = parse_args(args)
     logger = Tfd500(args.device)
-    result = args.func(logger, args) or 0
+    if args.profile or args.profile_memory:
+        result = _profile(logger, args) or 0
+    else:
+        result = args.func(logger, args) or 0
     sys.exit(result)
 
 